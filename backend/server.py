@@ -1,35 +1,81 @@
 from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File
+from fastapi.responses import ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import AsyncMongoClient, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import os
+import asyncio
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Dict, List, Optional
 import uuid
+import secrets
 from datetime import datetime, timedelta
 import math
+import bisect
+import numpy as np
 import pandas as pd
-import tempfile
+import io
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+
+# One client per event loop, so each loop owns its own connection pool
+# (multiple workers, test clients spinning up their own loops)
+_clients: Dict[asyncio.AbstractEventLoop, AsyncMongoClient] = {}
+# Close tasks for clients left behind by loops that have since been closed
+_closing: set = set()
+
+async def _close_stale_client(client: AsyncMongoClient):
+    try:
+        await client.close()
+    except Exception:
+        logger.debug("Error closing a stale MongoDB client", exc_info=True)
+
+def get_db():
+    loop = asyncio.get_running_loop()
+    # Loops that shut down without running the shutdown hook (each TestClient
+    # or asyncio.run) would otherwise keep their client and its pool open
+    for stale_loop in [other for other in _clients if other.is_closed()]:
+        task = loop.create_task(_close_stale_client(_clients.pop(stale_loop)))
+        _closing.add(task)
+        task.add_done_callback(_closing.discard)
+    client = _clients.get(loop)
+    if client is None:
+        client = AsyncMongoClient(mongo_url, maxPoolSize=50, minPoolSize=10, maxConnecting=4)
+        _clients[loop] = client
+    return client[os.environ['DB_NAME']]
+
+# Time-ordered ids keep index inserts append-only; uuid7 needs Python 3.14+
+new_uuid = getattr(uuid, "uuid7", uuid.uuid4)
+
+# Singleton stats_cache document holding running loan totals for /get-stats:
+# total_loans, total_amount, and rated_loans/payment_rate_sum (loans with a
+# tenure, and the sum of their emis_paid_on_time / tenure ratios)
+# Write paths only $inc an existing document, bumping its version; when it is
+# missing /get-stats rebuilds it from the loans collection
+STATS_CACHE_ID = "global"
+
+# Rebuilds retried when a write bumps the stats_cache version mid-aggregation
+STATS_REFRESH_ATTEMPTS = 3
+
+# Rows per bulk_write batch during Excel ingestion
+BULK_WRITE_CHUNK_SIZE = 1000
 
 # Create the main app without a prefix
-app = FastAPI(title="Credit Approval System", version="1.0.0")
+app = FastAPI(title="Credit Approval System", version="1.0.0", default_response_class=ORJSONResponse)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
 # Data Models
 class Customer(BaseModel):
-    customer_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    customer_id: str = Field(default_factory=lambda: str(new_uuid()))
     first_name: str
     last_name: str
     phone_number: Optional[str] = None
@@ -45,7 +91,7 @@ class CustomerCreate(BaseModel):
     monthly_salary: float
 
 class Loan(BaseModel):
-    loan_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    loan_id: str = Field(default_factory=lambda: str(new_uuid()))
     customer_id: str
     loan_amount: float
     tenure: int
@@ -77,16 +123,59 @@ class LoanPayment(BaseModel):
 class PaymentCreate(BaseModel):
     payment_amount: float
 
+class EligibilityResult(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    
+    customer_id: str
+    approval: bool
+    interest_rate: float
+    corrected_interest_rate: float
+    tenure: int
+    monthly_installment: float
+    credit_score: int
+
+# Per-customer loan aggregates, maintained with $inc on every loan write so
+# scoring never has to load the customer's loans
+EMPTY_CREDIT_STATS = {
+    "loan_count": 0,
+    "active_loan_count": 0,
+    "total_tenure": 0,
+    "paid_on_time": 0,
+    "total_monthly_repayment": 0.0,
+    "sum_loan_amount": 0.0
+}
+
+# $group accumulators producing the credit_stats fields from loan documents
+LOAN_STATS_ACCUMULATORS = {
+    "loan_count": {"$sum": 1},
+    "active_loan_count": {"$sum": {"$cond": [{"$eq": ["$status", "active"]}, 1, 0]}},
+    "total_tenure": {"$sum": "$tenure"},
+    "paid_on_time": {"$sum": "$emis_paid_on_time"},
+    "total_monthly_repayment": {"$sum": "$monthly_repayment"},
+    "sum_loan_amount": {"$sum": "$loan_amount"}
+}
+
+# Customer fields read by the eligibility checks
+SCORING_PROJECTION = {
+    "_id": 0,
+    "customer_id": 1,
+    "monthly_salary": 1,
+    "approved_limit": 1,
+    "current_debt": 1,
+    "credit_stats": 1
+}
+
 # Business Logic Functions
-def calculate_credit_score(customer: dict, loans: List[dict]) -> int:
+def calculate_credit_score(customer: dict, stats: dict) -> int:
     score = 500  # Base score
     
-    if not loans:
+    loan_count = stats.get('loan_count', 0)
+    if not loan_count:
         return score
     
     # Payment history (40% weight)
-    total_emis = sum(loan.get('tenure', 0) for loan in loans)
-    paid_on_time = sum(loan.get('emis_paid_on_time', 0) for loan in loans)
+    total_emis = stats.get('total_tenure', 0)
+    paid_on_time = stats.get('paid_on_time', 0)
     payment_ratio = paid_on_time / total_emis if total_emis > 0 else 0
     score += int(payment_ratio * 200)  # Max 200 points
     
@@ -95,17 +184,15 @@ def calculate_credit_score(customer: dict, loans: List[dict]) -> int:
     score += int((1 - debt_ratio) * 150)  # Max 150 points
     
     # Loan activity (20% weight)
-    if len(loans) > 0:
-        score += 100
-    if len(loans) > 3:
+    score += 100
+    if loan_count > 3:
         score += 50
     
     # Income ratio (10% weight)
-    if loans:
-        avg_loan_amount = sum(loan.get('loan_amount', 0) for loan in loans) / len(loans)
-        income_ratio = customer.get('monthly_salary', 0) / avg_loan_amount if avg_loan_amount > 0 else 0
-        if income_ratio > 2:
-            score += 50
+    avg_loan_amount = stats.get('sum_loan_amount', 0) / loan_count
+    income_ratio = customer.get('monthly_salary', 0) / avg_loan_amount if avg_loan_amount > 0 else 0
+    if income_ratio > 2:
+        score += 50
     
     return max(min(score, 850), 300)  # Clamp between 300-850
 
@@ -113,17 +200,174 @@ def calculate_emi(principal: float, rate: float, tenure: int) -> float:
     monthly_rate = rate / (12 * 100)
     if monthly_rate == 0:
         return principal / tenure
-    emi = (principal * monthly_rate * pow(1 + monthly_rate, tenure)) / (pow(1 + monthly_rate, tenure) - 1)
+    factor = (1 + monthly_rate) ** tenure
+    emi = principal * monthly_rate * factor / (factor - 1)
     return round(emi, 2)
 
+def calculate_emi_array(principal: np.ndarray, rate: np.ndarray, tenure: np.ndarray) -> np.ndarray:
+    """Vectorized calculate_emi for whole spreadsheet columns; NaN where tenure <= 0."""
+    monthly_rate = rate / (12 * 100)
+    valid = tenure > 0
+    factor = (1 + monthly_rate) ** np.where(valid, tenure, 0)
+    emi = np.full(monthly_rate.shape, np.nan)
+    np.divide(principal, tenure, out=emi, where=valid & (monthly_rate == 0))
+    np.divide(principal * monthly_rate * factor, factor - 1, out=emi, where=valid & (monthly_rate != 0))
+    return np.round(emi, 2)
+
+# Credit score band lower bounds and the rate for each band
+INTEREST_RATE_THRESHOLDS = [550, 650, 750]
+INTEREST_RATES = [15.0, 12.0, 10.0, 8.0]
+
 def determine_interest_rate(credit_score: int) -> float:
-    if credit_score >= 750:
-        return 8.0
-    elif credit_score >= 650:
-        return 10.0
-    elif credit_score >= 550:
-        return 12.0
-    return 15.0
+    return INTEREST_RATES[bisect.bisect_right(INTEREST_RATE_THRESHOLDS, credit_score)]
+
+def find_column(columns: set, field_variations: List[str]) -> Optional[str]:
+    return next((variation for variation in field_variations if variation in columns), None)
+
+def read_excel_upload(content: bytes, filename: str, dtype: dict) -> pd.DataFrame:
+    """Parse an uploaded workbook straight from memory."""
+    engine = "openpyxl" if filename.endswith('.xlsx') else None
+    return pd.read_excel(io.BytesIO(content), engine=engine, dtype=dtype)
+
+def random_uuids(count: int) -> List[str]:
+    """Generate UUID4 strings from a single CSPRNG read."""
+    rnd = secrets.token_bytes(16 * count)
+    return [str(uuid.UUID(bytes=rnd[i * 16:(i + 1) * 16], version=4)) for i in range(count)]
+
+def fill_missing_ids(ids: pd.Series) -> pd.Series:
+    """Stringify spreadsheet ids, generating UUIDs for blank cells."""
+    mask = ids.isna().to_numpy()
+    values = ids.astype(str).to_numpy(dtype=object)
+    values[mask] = random_uuids(int(mask.sum()))
+    return pd.Series(values, index=ids.index)
+
+def chunks(seq, n):
+    return [seq[i:i + n] for i in range(0, len(seq), n)]
+
+async def bulk_upsert(collection, ops: list) -> int:
+    """Submit write ops as concurrent unordered bulk writes, skipping rows the server rejects."""
+    async def write(batch):
+        try:
+            result = await collection.bulk_write(batch, ordered=False)
+            return result.upserted_count + result.modified_count
+        except BulkWriteError as e:
+            return e.details.get("nUpserted", 0) + e.details.get("nModified", 0)
+
+    results = await asyncio.gather(*(write(batch) for batch in chunks(ops, BULK_WRITE_CHUNK_SIZE)))
+    return sum(results)
+
+async def _loan_agg(customer_id: str) -> dict:
+    pipeline = [
+        {"$match": {"customer_id": customer_id}},
+        {"$group": {"_id": None, **LOAN_STATS_ACCUMULATORS}},
+        {"$project": {"_id": 0}}
+    ]
+    cursor = await get_db().loans.aggregate(pipeline)
+    result = await cursor.to_list(length=1)
+    return result[0] if result else dict(EMPTY_CREDIT_STATS)
+
+async def get_credit_stats(customer: dict) -> dict:
+    """Materialized credit_stats, backfilled from the loans collection for older customers."""
+    if customer.get("credit_stats"):
+        return customer["credit_stats"]
+    
+    stats = await _loan_agg(customer["customer_id"])
+    await get_db().customers.update_one(
+        {"customer_id": customer["customer_id"], "credit_stats": {"$exists": False}},
+        {"$set": {"credit_stats": stats}}
+    )
+    return stats
+
+async def refresh_credit_stats(customer_ids: List[str]) -> None:
+    """Rebuild credit_stats from the loans collection after a bulk import."""
+    if not customer_ids:
+        return
+    pipeline = [
+        {"$match": {"customer_id": {"$in": customer_ids}}},
+        {"$group": {"_id": "$customer_id", **LOAN_STATS_ACCUMULATORS}}
+    ]
+    stats = {customer_id: EMPTY_CREDIT_STATS for customer_id in customer_ids}
+    async for doc in await get_db().loans.aggregate(pipeline):
+        stats[doc.pop("_id")] = doc
+    
+    ops = [
+        UpdateOne({"customer_id": customer_id}, {"$set": {"credit_stats": customer_stats}})
+        for customer_id, customer_stats in stats.items()
+    ]
+    await bulk_upsert(get_db().customers, ops)
+
+async def refresh_stats_cache() -> dict:
+    """Recompute the loan figures behind /get-stats and store them in stats_cache.
+    
+    The rebuild is only stored if the cache version is unchanged, so an
+    increment landing during the aggregation is not overwritten. A loan whose
+    insert and increment straddle the aggregation can still be counted twice
+    or missed; to reconcile, delete the stats_cache document and the next
+    /get-stats rebuilds it.
+    """
+    for _ in range(STATS_REFRESH_ATTEMPTS):
+        current = await get_db().stats_cache.find_one({"_id": STATS_CACHE_ID}, {"version": 1})
+        loan_stats = await _aggregate_loan_stats()
+        if current is None:
+            try:
+                await get_db().stats_cache.insert_one({"_id": STATS_CACHE_ID, "version": 0, **loan_stats})
+                return loan_stats
+            except DuplicateKeyError:
+                continue
+        result = await get_db().stats_cache.update_one(
+            {"_id": STATS_CACHE_ID, "version": current.get("version")},
+            {"$set": loan_stats}
+        )
+        if result.matched_count:
+            return loan_stats
+    # Kept losing the race; serve the fresh figures and leave the stored ones
+    logger.warning("stats_cache rebuild gave up after %d attempts", STATS_REFRESH_ATTEMPTS)
+    return loan_stats
+
+async def _aggregate_loan_stats() -> dict:
+    # Loan totals and payment rate in one pass over loans
+    loan_pipeline = [
+        {
+            "$facet": {
+                "totals": [
+                    {
+                        "$group": {
+                            "_id": None,
+                            "total_loans": {"$sum": 1},
+                            "total_amount": {"$sum": "$loan_amount"}
+                        }
+                    }
+                ],
+                "payment_rate": [
+                    {"$match": {"tenure": {"$gt": 0}}},
+                    {
+                        "$group": {
+                            "_id": None,
+                            "rated_loans": {"$sum": 1},
+                            "payment_rate_sum": {
+                                "$sum": {
+                                    "$divide": ["$emis_paid_on_time", "$tenure"]
+                                }
+                            }
+                        }
+                    }
+                ]
+            }
+        }
+    ]
+    
+    cursor = await get_db().loans.aggregate(loan_pipeline)
+    loan_facets = await cursor.to_list(length=1)
+    totals = loan_facets[0]["totals"] if loan_facets else []
+    payment_rate = loan_facets[0]["payment_rate"] if loan_facets else []
+    
+    loan_stats = {
+        "total_loans": totals[0]["total_loans"] if totals else 0,
+        "total_amount": totals[0]["total_amount"] if totals else 0,
+        "rated_loans": payment_rate[0]["rated_loans"] if payment_rate else 0,
+        "payment_rate_sum": payment_rate[0]["payment_rate_sum"] if payment_rate else 0
+    }
+    return loan_stats
 
 # API Routes
 
@@ -133,7 +377,8 @@ async def root():
 
 @api_router.post("/register")
 async def register_customer(customer_data: CustomerCreate):
-    customer_id = str(uuid.uuid4())
+    now = datetime.utcnow()
+    customer_id = str(new_uuid())
     approved_limit = round(36 * customer_data.monthly_salary)  # 36x monthly salary
     
     customer_doc = {
@@ -144,11 +389,12 @@ async def register_customer(customer_data: CustomerCreate):
         "monthly_salary": customer_data.monthly_salary,
         "approved_limit": approved_limit,
         "current_debt": 0.0,
-        "created_at": datetime.utcnow()
+        "credit_stats": dict(EMPTY_CREDIT_STATS),
+        "created_at": now
     }
     
     try:
-        await db.customers.insert_one(customer_doc)
+        await get_db().customers.insert_one(customer_doc)
         return {
             "customer_id": customer_id,
             "name": f"{customer_data.first_name} {customer_data.last_name}",
@@ -162,20 +408,17 @@ async def register_customer(customer_data: CustomerCreate):
 @api_router.post("/check-eligibility")
 async def check_eligibility(eligibility_data: LoanEligibility):
     # Get customer data
-    customer = await db.customers.find_one({"customer_id": eligibility_data.customer_id})
+    customer = await get_db().customers.find_one({"customer_id": eligibility_data.customer_id}, SCORING_PROJECTION)
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
-    # Get customer's loans
-    loans_cursor = db.loans.find({"customer_id": eligibility_data.customer_id})
-    loans = await loans_cursor.to_list(length=1000)
-    
-    credit_score = calculate_credit_score(customer, loans)
+    stats = await get_credit_stats(customer)
+    credit_score = calculate_credit_score(customer, stats)
     suggested_rate = determine_interest_rate(credit_score)
     emi = calculate_emi(eligibility_data.loan_amount, eligibility_data.interest_rate, eligibility_data.tenure)
     
     # Check eligibility criteria
-    total_emi = sum(loan.get('monthly_repayment', 0) for loan in loans) + emi
+    total_emi = stats.get('total_monthly_repayment', 0) + emi
     emi_to_income_ratio = total_emi / customer['monthly_salary']
     new_debt = customer['current_debt'] + eligibility_data.loan_amount
     
@@ -192,29 +435,27 @@ async def check_eligibility(eligibility_data: LoanEligibility):
     elif credit_score < 650:
         corrected_interest_rate = max(eligibility_data.interest_rate, suggested_rate)
     
-    return {
-        "customer_id": eligibility_data.customer_id,
-        "approval": approval,
-        "interest_rate": corrected_interest_rate,
-        "corrected_interest_rate": corrected_interest_rate,
-        "tenure": eligibility_data.tenure,
-        "monthly_installment": calculate_emi(eligibility_data.loan_amount, corrected_interest_rate, eligibility_data.tenure),
-        "credit_score": credit_score
-    }
+    return EligibilityResult(
+        customer_id=eligibility_data.customer_id,
+        approval=approval,
+        interest_rate=corrected_interest_rate,
+        corrected_interest_rate=corrected_interest_rate,
+        tenure=eligibility_data.tenure,
+        monthly_installment=calculate_emi(eligibility_data.loan_amount, corrected_interest_rate, eligibility_data.tenure),
+        credit_score=credit_score
+    )
 
 @api_router.post("/create-loan")
 async def create_loan(loan_data: LoanCreate):
     # First check eligibility
-    customer = await db.customers.find_one({"customer_id": loan_data.customer_id})
+    customer = await get_db().customers.find_one({"customer_id": loan_data.customer_id}, SCORING_PROJECTION)
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
-    loans_cursor = db.loans.find({"customer_id": loan_data.customer_id})
-    loans = await loans_cursor.to_list(length=1000)
-    
-    credit_score = calculate_credit_score(customer, loans)
+    stats = await get_credit_stats(customer)
+    credit_score = calculate_credit_score(customer, stats)
     emi = calculate_emi(loan_data.loan_amount, loan_data.interest_rate, loan_data.tenure)
-    total_emi = sum(loan.get('monthly_repayment', 0) for loan in loans) + emi
+    total_emi = stats.get('total_monthly_repayment', 0) + emi
     emi_to_income_ratio = total_emi / customer['monthly_salary']
     new_debt = customer['current_debt'] + loan_data.loan_amount
     
@@ -225,9 +466,9 @@ async def create_loan(loan_data: LoanCreate):
             detail="Loan not approved - Customer does not meet eligibility criteria"
         )
     
-    loan_id = str(uuid.uuid4())
-    start_date = datetime.utcnow()
-    end_date = start_date + timedelta(days=loan_data.tenure * 30)
+    now = datetime.utcnow()
+    loan_id = str(new_uuid())
+    end_date = now + timedelta(days=loan_data.tenure * 30)
     
     loan_doc = {
         "loan_id": loan_id,
@@ -237,30 +478,74 @@ async def create_loan(loan_data: LoanCreate):
         "interest_rate": loan_data.interest_rate,
         "monthly_repayment": emi,
         "emis_paid_on_time": 0,
-        "start_date": start_date,
+        "start_date": now,
         "end_date": end_date,
         "status": "active",
-        "created_at": datetime.utcnow()
+        "created_at": now
+    }
+    
+    loan_increments = {
+        "current_debt": loan_data.loan_amount,
+        "credit_stats.loan_count": 1,
+        "credit_stats.active_loan_count": 1,
+        "credit_stats.total_tenure": loan_data.tenure,
+        "credit_stats.total_monthly_repayment": emi,
+        "credit_stats.sum_loan_amount": loan_data.loan_amount
     }
     
+    # Re-check the debt and EMI limits server-side while reserving the debt, so
+    # concurrent requests cannot both pass the checks above
+    reserved = await get_db().customers.find_one_and_update(
+        {
+            "customer_id": loan_data.customer_id,
+            "$expr": {"$and": [
+                {"$lte": [{"$add": ["$current_debt", loan_data.loan_amount]}, "$approved_limit"]},
+                {"$lte": [
+                    {"$add": ["$credit_stats.total_monthly_repayment", emi]},
+                    {"$multiply": ["$monthly_salary", 0.5]}
+                ]}
+            ]}
+        },
+        {"$inc": loan_increments},
+        projection={"_id": 1}
+    )
+    if reserved is None:
+        raise HTTPException(
+            status_code=400, 
+            detail="Loan not approved - Customer does not meet eligibility criteria"
+        )
+    
     try:
-        await db.loans.insert_one(loan_doc)
-        
-        # Update customer debt
-        await db.customers.update_one(
+        await get_db().loans.insert_one(loan_doc)
+    except Exception as e:
+        # Release the reserved debt
+        await get_db().customers.update_one(
             {"customer_id": loan_data.customer_id},
-            {"$inc": {"current_debt": loan_data.loan_amount}}
+            {"$inc": {field: -amount for field, amount in loan_increments.items()}}
         )
-        
-        return {
-            "loan_id": loan_id,
-            "customer_id": loan_data.customer_id,
-            "loan_approved": True,
-            "message": "Loan approved successfully",
-            "monthly_installment": emi
-        }
-    except Exception as e:
         raise HTTPException(status_code=400, detail="Loan creation failed")
+    
+    # The loan exists now; a failed cache update must not undo the reservation
+    try:
+        await get_db().stats_cache.update_one(
+            {"_id": STATS_CACHE_ID},
+            {"$inc": {
+                "total_loans": 1,
+                "total_amount": loan_data.loan_amount,
+                "rated_loans": 1 if loan_data.tenure > 0 else 0,
+                "version": 1
+            }}
+        )
+    except Exception:
+        logger.exception("Failed to update stats cache for loan %s", loan_id)
+    
+    return {
+        "loan_id": loan_id,
+        "customer_id": loan_data.customer_id,
+        "loan_approved": True,
+        "message": "Loan approved successfully",
+        "monthly_installment": emi
+    }
 
 @api_router.get("/view-loan/{loan_id}")
 async def view_loan(loan_id: str):
@@ -273,10 +558,25 @@ async def view_loan(loan_id: str):
             "foreignField": "customer_id",
             "as": "customer"
         }},
-        {"$unwind": "$customer"}
+        {"$unwind": "$customer"},
+        {"$project": {
+            "_id": 0,
+            "loan_id": 1,
+            "customer_id": 1,
+            "loan_amount": 1,
+            "interest_rate": 1,
+            "monthly_repayment": 1,
+            "tenure": 1,
+            "emis_paid_on_time": 1,
+            "start_date": 1,
+            "end_date": 1,
+            "status": 1,
+            "customer.first_name": 1,
+            "customer.last_name": 1
+        }}
     ]
     
-    cursor = db.loans.aggregate(pipeline)
+    cursor = await get_db().loans.aggregate(pipeline)
     loan_data = await cursor.to_list(length=1)
     
     if not loan_data:
@@ -303,113 +603,98 @@ async def view_loan(loan_id: str):
 
 @api_router.get("/view-loans/{customer_id}")
 async def view_customer_loans(customer_id: str):
-    loans_cursor = db.loans.find({"customer_id": customer_id})
-    loans = await loans_cursor.to_list(length=1000)
-    
-    formatted_loans = []
-    for loan in loans:
-        formatted_loans.append({
-            "loan_id": loan["loan_id"],
-            "loan_amount": loan["loan_amount"],
-            "interest_rate": loan["interest_rate"],
-            "monthly_installment": loan["monthly_repayment"],
-            "repayments_left": loan["tenure"] - loan["emis_paid_on_time"],
-            "status": loan["status"]
-        })
-    
-    return formatted_loans
+    # Shape the response server-side and stream it instead of buffering raw loans
+    pipeline = [
+        {"$match": {"customer_id": customer_id}},
+        {"$project": {
+            "_id": 0,
+            "loan_id": 1,
+            "loan_amount": 1,
+            "interest_rate": 1,
+            "monthly_installment": "$monthly_repayment",
+            "repayments_left": {"$subtract": ["$tenure", "$emis_paid_on_time"]},
+            "status": 1
+        }}
+    ]
+    
+    return [loan async for loan in await get_db().loans.aggregate(pipeline)]
 
 @api_router.post("/make-payment/{loan_id}")
 async def make_payment(loan_id: str, payment_data: PaymentCreate):
-    loan = await db.loans.find_one({"loan_id": loan_id})
+    loan = await get_db().loans.find_one(
+        {"loan_id": loan_id},
+        {"_id": 0, "customer_id": 1, "monthly_repayment": 1, "tenure": 1}
+    )
     if not loan:
         raise HTTPException(status_code=404, detail="Loan not found")
     
     # Record payment
+    now = datetime.utcnow()
     payment_doc = {
         "loan_id": loan_id,
         "payment_amount": payment_data.payment_amount,
-        "payment_date": datetime.utcnow()
+        "payment_date": now
     }
     
     try:
-        await db.loan_payments.insert_one(payment_doc)
+        await get_db().loan_payments.insert_one(payment_doc)
         
         # Update EMIs paid on time if payment matches monthly repayment
         if abs(payment_data.payment_amount - loan['monthly_repayment']) < 0.01:
-            await db.loans.update_one(
-                {"loan_id": loan_id},
-                {"$inc": {"emis_paid_on_time": 1}}
-            )
+            updates = [
+                get_db().loans.update_one(
+                    {"loan_id": loan_id},
+                    {"$inc": {"emis_paid_on_time": 1}}
+                ),
+                get_db().customers.update_one(
+                    {"customer_id": loan["customer_id"], "credit_stats": {"$exists": True}},
+                    {"$inc": {"credit_stats.paid_on_time": 1}}
+                )
+            ]
+            if loan.get("tenure", 0) > 0:
+                updates.append(get_db().stats_cache.update_one(
+                    {"_id": STATS_CACHE_ID},
+                    {"$inc": {"payment_rate_sum": 1 / loan["tenure"], "version": 1}}
+                ))
+            await asyncio.gather(*updates)
         
         return {
             "message": "Payment recorded successfully",
             "loan_id": loan_id,
             "payment_amount": payment_data.payment_amount,
-            "payment_date": datetime.utcnow().date().isoformat()
+            "payment_date": now.date()
         }
     except Exception as e:
         raise HTTPException(status_code=400, detail="Payment recording failed")
 
 @api_router.get("/get-stats")
 async def get_stats():
-    # Get customer count
-    customer_count = await db.customers.count_documents({})
-    
-    # Get loan stats
-    loan_pipeline = [
-        {
-            "$group": {
-                "_id": None,
-                "total_loans": {"$sum": 1},
-                "total_amount": {"$sum": "$loan_amount"}
-            }
-        }
-    ]
+    customer_count, loan_stats = await asyncio.gather(
+        get_db().customers.estimated_document_count(),
+        get_db().stats_cache.find_one({"_id": STATS_CACHE_ID})
+    )
+    if loan_stats is None:
+        loan_stats = await refresh_stats_cache()
     
-    loan_stats_cursor = db.loans.aggregate(loan_pipeline)
-    loan_stats = await loan_stats_cursor.to_list(length=1)
-    loan_stats = loan_stats[0] if loan_stats else {"total_loans": 0, "total_amount": 0}
-    
-    # Get payment rate
-    payment_pipeline = [
-        {
-            "$match": {"tenure": {"$gt": 0}}
-        },
-        {
-            "$group": {
-                "_id": None,
-                "avg_payment_rate": {
-                    "$avg": {
-                        "$divide": ["$emis_paid_on_time", "$tenure"]
-                    }
-                }
-            }
-        }
-    ]
-    
-    payment_stats_cursor = db.loans.aggregate(payment_pipeline)
-    payment_stats = await payment_stats_cursor.to_list(length=1)
-    avg_payment_rate = payment_stats[0]["avg_payment_rate"] if payment_stats else 0
+    rated_loans = loan_stats.get("rated_loans", 0)
+    avg_payment_rate = loan_stats.get("payment_rate_sum", 0) / rated_loans if rated_loans else 0
     
     return {
         "total_customers": customer_count,
-        "total_loans": loan_stats["total_loans"],
-        "total_loan_amount": loan_stats["total_amount"],
+        "total_loans": loan_stats.get("total_loans", 0),
+        "total_loan_amount": loan_stats.get("total_amount", 0),
         "average_payment_rate": avg_payment_rate * 100,
         "default_rate": max(0, (1 - avg_payment_rate) * 100)
     }
 
 @api_router.get("/get-customer/{customer_id}")
 async def get_customer(customer_id: str):
-    customer = await db.customers.find_one({"customer_id": customer_id})
+    customer = await get_db().customers.find_one({"customer_id": customer_id}, {"_id": 0, "created_at": 0})
     if not customer:
         raise HTTPException(status_code=404, detail="Customer not found")
     
-    loans_cursor = db.loans.find({"customer_id": customer_id})
-    loans = await loans_cursor.to_list(length=1000)
-    
-    credit_score = calculate_credit_score(customer, loans)
+    stats = await get_credit_stats(customer)
+    credit_score = calculate_credit_score(customer, stats)
     
     return {
         "customer_id": customer["customer_id"],
@@ -420,8 +705,8 @@ async def get_customer(customer_id: str):
         "approved_limit": customer["approved_limit"],
         "current_debt": customer["current_debt"],
         "credit_score": credit_score,
-        "total_loans": len(loans),
-        "active_loans": len([loan for loan in loans if loan.get("status") == "active"])
+        "total_loans": stats.get("loan_count", 0),
+        "active_loans": stats.get("active_loan_count", 0)
     }
 
 @api_router.post("/ingest-data")
@@ -431,104 +716,122 @@ async def ingest_data(
 ):
     processed_customers = 0
     processed_loans = 0
+    touched_customers = set()
+    now = datetime.utcnow()
     
     try:
         # Process customer data
         if customer_data and customer_data.filename.endswith(('.xlsx', '.xls')):
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp:
-                tmp.write(await customer_data.read())
-                tmp.flush()
-                
-                df = pd.read_excel(tmp.name)
-                
-                # Column mapping for flexibility
-                column_map = {
-                    'customer_id': ['customer_id', 'Customer ID', 'customer id'],
-                    'first_name': ['first_name', 'First Name', 'first name'],
-                    'last_name': ['last_name', 'Last Name', 'last name'],
-                    'phone_number': ['phone_number', 'Phone Number', 'phone number', 'Phone'],
-                    'monthly_salary': ['monthly_salary', 'Monthly Salary', 'monthly salary', 'Salary'],
-                    'approved_limit': ['approved_limit', 'Approved Limit', 'approved limit'],
-                    'current_debt': ['current_debt', 'Current Debt', 'current debt']
-                }
-                
-                def find_column(df_columns, field_variations):
-                    for variation in field_variations:
-                        if variation in df_columns:
-                            return variation
-                    return None
-                
-                for _, row in df.iterrows():
-                    customer_doc = {
-                        "customer_id": str(row.get(find_column(df.columns, column_map['customer_id']) or 'customer_id', str(uuid.uuid4()))),
-                        "first_name": row[find_column(df.columns, column_map['first_name'])],
-                        "last_name": row[find_column(df.columns, column_map['last_name'])],
-                        "phone_number": row.get(find_column(df.columns, column_map['phone_number'])),
-                        "monthly_salary": float(row[find_column(df.columns, column_map['monthly_salary'])]),
-                        "approved_limit": float(row[find_column(df.columns, column_map['approved_limit'])]),
-                        "current_debt": float(row.get(find_column(df.columns, column_map['current_debt']) or 'current_debt', 0)),
-                        "created_at": datetime.utcnow()
-                    }
-                    
-                    try:
-                        await db.customers.replace_one(
-                            {"customer_id": customer_doc["customer_id"]},
-                            customer_doc,
-                            upsert=True
-                        )
-                        processed_customers += 1
-                    except:
-                        continue
-                
-                os.unlink(tmp.name)
+            # Column mapping for flexibility
+            column_map = {
+                'customer_id': ['customer_id', 'Customer ID', 'customer id'],
+                'first_name': ['first_name', 'First Name', 'first name'],
+                'last_name': ['last_name', 'Last Name', 'last name'],
+                'phone_number': ['phone_number', 'Phone Number', 'phone number', 'Phone'],
+                'monthly_salary': ['monthly_salary', 'Monthly Salary', 'monthly salary', 'Salary'],
+                'approved_limit': ['approved_limit', 'Approved Limit', 'approved limit'],
+                'current_debt': ['current_debt', 'Current Debt', 'current debt']
+            }
+            column_dtypes = {'monthly_salary': 'float64', 'approved_limit': 'float64', 'current_debt': 'float64'}
+            
+            df = read_excel_upload(
+                await customer_data.read(),
+                customer_data.filename,
+                {variation: dtype for field, dtype in column_dtypes.items() for variation in column_map[field]}
+            )
+            
+            # Resolve columns once per sheet and normalize the whole frame
+            columns = set(df.columns)
+            resolved = {field: find_column(columns, variations) for field, variations in column_map.items()}
+            df = df.rename(columns={v: k for k, v in resolved.items() if v})
+            
+            for field in ('customer_id', 'phone_number', 'current_debt'):
+                if field not in df.columns:
+                    df[field] = None
+            
+            df["customer_id"] = fill_missing_ids(df["customer_id"])
+            df["monthly_salary"] = df["monthly_salary"].astype(float)
+            df["approved_limit"] = df["approved_limit"].astype(float)
+            df["current_debt"] = pd.to_numeric(df["current_debt"]).fillna(0).astype(float)
+            df["created_at"] = now
+            
+            df = df[list(column_map) + ["created_at"]]
+            df = df.astype(object).where(pd.notna(df), None)
+            
+            ops = [
+                ReplaceOne({"customer_id": doc["customer_id"]}, doc, upsert=True)
+                for doc in df.to_dict("records")
+            ]
+            processed_customers = await bulk_upsert(get_db().customers, ops)
+            touched_customers.update(df["customer_id"])
         
         # Process loan data
         if loan_data and loan_data.filename.endswith(('.xlsx', '.xls')):
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx') as tmp:
-                tmp.write(await loan_data.read())
-                tmp.flush()
-                
-                df = pd.read_excel(tmp.name)
-                
-                # Column mapping for loan data
-                loan_column_map = {
-                    'loan_id': ['loan_id', 'Loan ID', 'loan id'],
-                    'customer_id': ['customer_id', 'Customer ID', 'customer id'],
-                    'loan_amount': ['loan_amount', 'Loan Amount', 'loan amount'],
-                    'tenure': ['tenure', 'Tenure'],
-                    'interest_rate': ['interest_rate', 'Interest Rate', 'interest rate'],
-                    'monthly_repayment': ['monthly_repayment', 'Monthly payment', 'monthly payment', 'Monthly Payment', 'EMI'],
-                    'emis_paid_on_time': ['emis_paid_on_time', 'EMIs paid on Time', 'emis paid on time'],
-                    'start_date': ['start_date', 'Date of Approval', 'start date', 'approval date'],
-                    'end_date': ['end_date', 'End Date', 'end date']
-                }
-                
-                for _, row in df.iterrows():
-                    loan_doc = {
-                        "loan_id": str(row.get(find_column(df.columns, loan_column_map['loan_id']) or 'loan_id', str(uuid.uuid4()))),
-                        "customer_id": str(row[find_column(df.columns, loan_column_map['customer_id'])]),
-                        "loan_amount": float(row[find_column(df.columns, loan_column_map['loan_amount'])]),
-                        "tenure": int(row[find_column(df.columns, loan_column_map['tenure'])]),
-                        "interest_rate": float(row[find_column(df.columns, loan_column_map['interest_rate'])]),
-                        "monthly_repayment": float(row[find_column(df.columns, loan_column_map['monthly_repayment'])]),
-                        "emis_paid_on_time": int(row.get(find_column(df.columns, loan_column_map['emis_paid_on_time']) or 'emis_paid_on_time', 0)),
-                        "start_date": pd.to_datetime(row[find_column(df.columns, loan_column_map['start_date'])]).to_pydatetime() if find_column(df.columns, loan_column_map['start_date']) in row and pd.notna(row[find_column(df.columns, loan_column_map['start_date'])]) else datetime.utcnow(),
-                        "end_date": pd.to_datetime(row[find_column(df.columns, loan_column_map['end_date'])]).to_pydatetime() if find_column(df.columns, loan_column_map['end_date']) in row and pd.notna(row[find_column(df.columns, loan_column_map['end_date'])]) else datetime.utcnow(),
-                        "status": row.get('status', 'active'),
-                        "created_at": datetime.utcnow()
-                    }
-                    
-                    try:
-                        await db.loans.replace_one(
-                            {"loan_id": loan_doc["loan_id"]},
-                            loan_doc,
-                            upsert=True
-                        )
-                        processed_loans += 1
-                    except:
-                        continue
-                
-                os.unlink(tmp.name)
+            # Column mapping for loan data
+            loan_column_map = {
+                'loan_id': ['loan_id', 'Loan ID', 'loan id'],
+                'customer_id': ['customer_id', 'Customer ID', 'customer id'],
+                'loan_amount': ['loan_amount', 'Loan Amount', 'loan amount'],
+                'tenure': ['tenure', 'Tenure'],
+                'interest_rate': ['interest_rate', 'Interest Rate', 'interest rate'],
+                'monthly_repayment': ['monthly_repayment', 'Monthly payment', 'monthly payment', 'Monthly Payment', 'EMI'],
+                'emis_paid_on_time': ['emis_paid_on_time', 'EMIs paid on Time', 'emis paid on time'],
+                'start_date': ['start_date', 'Date of Approval', 'start date', 'approval date'],
+                'end_date': ['end_date', 'End Date', 'end date']
+            }
+            loan_column_dtypes = {'tenure': 'int64'}
+            
+            df = read_excel_upload(
+                await loan_data.read(),
+                loan_data.filename,
+                {variation: dtype for field, dtype in loan_column_dtypes.items() for variation in loan_column_map[field]}
+            )
+            
+            columns = set(df.columns)
+            resolved = {field: find_column(columns, variations) for field, variations in loan_column_map.items()}
+            df = df.rename(columns={v: k for k, v in resolved.items() if v})
+            
+            for field in ('loan_id', 'monthly_repayment', 'emis_paid_on_time', 'start_date', 'end_date'):
+                if field not in df.columns:
+                    df[field] = None
+            if 'status' not in df.columns:
+                df['status'] = 'active'
+            
+            df["loan_id"] = fill_missing_ids(df["loan_id"])
+            df["customer_id"] = df["customer_id"].astype(str)
+            df["loan_amount"] = df["loan_amount"].astype(float)
+            df["tenure"] = df["tenure"].astype(int)
+            df["interest_rate"] = df["interest_rate"].astype(float)
+            df["monthly_repayment"] = pd.to_numeric(df["monthly_repayment"]).astype(float)
+            missing_emi = df["monthly_repayment"].isna()
+            if missing_emi.any():
+                computed_emi = calculate_emi_array(
+                    df["loan_amount"].to_numpy(),
+                    df["interest_rate"].to_numpy(),
+                    df["tenure"].to_numpy()
+                )
+                df["monthly_repayment"] = df["monthly_repayment"].where(~missing_emi, computed_emi)
+                # No EMI given and none computable (tenure <= 0): skip the row
+                df = df[df["monthly_repayment"].notna()].copy()
+            df["emis_paid_on_time"] = pd.to_numeric(df["emis_paid_on_time"]).fillna(0).astype(int)
+            df["start_date"] = pd.to_datetime(df["start_date"], errors="coerce").fillna(now)
+            df["end_date"] = pd.to_datetime(df["end_date"], errors="coerce").fillna(now)
+            df["status"] = df["status"].fillna('active')
+            df["created_at"] = now
+            
+            df = df[list(loan_column_map) + ["status", "created_at"]]
+            
+            ops = [
+                ReplaceOne({"loan_id": doc["loan_id"]}, doc, upsert=True)
+                for doc in df.to_dict("records")
+            ]
+            processed_loans = await bulk_upsert(get_db().loans, ops)
+            touched_customers.update(df["customer_id"])
+        
+        # Replaced customer docs and imported loans both invalidate credit_stats
+        await refresh_credit_stats(list(touched_customers))
+        if processed_loans:
+            await refresh_stats_cache()
         
         return {
             "message": "Data ingestion completed",
@@ -541,17 +844,21 @@ async def ingest_data(
 
 @api_router.get("/health")
 async def health_check():
-    return {"status": "OK", "timestamp": datetime.utcnow().isoformat()}
+    return {"status": "OK", "timestamp": datetime.utcnow()}
 
 # Include the router in the main app
 app.include_router(api_router)
 
+# Comma-separated origin allowlist; browsers cache preflights for max_age seconds
+cors_origins = frozenset(origin.strip() for origin in os.environ.get('CORS_ORIGINS', '*').split(',') if origin.strip())
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=cors_origins,
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type", "authorization"],
+    max_age=86400,
 )
 
 # Configure logging
@@ -561,6 +868,23 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def ensure_indexes():
+    await asyncio.gather(
+        get_db().customers.create_index("customer_id", unique=True),
+        get_db().loans.create_index("loan_id", unique=True),
+        get_db().loans.create_index("customer_id"),
+        get_db().loan_payments.create_index("loan_id"),
+    )
+
+@app.on_event("startup")
+async def seed_stats_cache():
+    # Build the running totals before the first loan write increments them
+    if await get_db().stats_cache.find_one({"_id": STATS_CACHE_ID}, {"_id": 1}) is None:
+        await refresh_stats_cache()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.close()
\ No newline at end of file
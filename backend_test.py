@@ -4,73 +4,225 @@ Comprehensive Backend API Testing for Credit Approval System
 Tests all FastAPI endpoints converted from Node.js/SQLite to FastAPI/MongoDB
 """
 
+import pytest
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import orjson
 import sys
 from datetime import datetime
 import time
+import threading
+import asyncio
+from collections import Counter
+import functools
+import hashlib
+import io
+import os
+import socket
+from pathlib import Path
+from urllib.parse import urlparse
+import numpy as np
+
+# Parse the frontend .env once per process
+@functools.lru_cache(maxsize=1)
+def _env():
+    try:
+        lines = Path('/app/frontend/.env').read_text().splitlines()
+    except OSError:
+        return {}
+    return dict(line.split('=', 1) for line in lines if '=' in line)
 
 # Get backend URL from frontend .env
-def get_backend_url():
+BASE_URL = _env().get('REACT_APP_BACKEND_URL', 'http://localhost:8001').strip()
+API_URL = f"{BASE_URL}/api"
+
+# Endpoint URLs; the {} ones take an id via .format()
+URL_HEALTH = f"{API_URL}/"
+URL_REGISTER = f"{API_URL}/register"
+URL_GET_CUSTOMER = f"{API_URL}/get-customer/{{}}"
+URL_CHECK = f"{API_URL}/check-eligibility"
+URL_CREATE_LOAN = f"{API_URL}/create-loan"
+URL_VIEW_LOANS = f"{API_URL}/view-loans/{{}}"
+URL_PAY = f"{API_URL}/make-payment/{{}}"
+URL_STATS = f"{API_URL}/get-stats"
+URL_INGEST = f"{API_URL}/ingest-data"
+
+# Shared session so every test reuses pooled keep-alive connections
+SESSION = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    # Read and status retries only for idempotent methods: a POST that times out
+    # after the server committed must not register or lend twice. Connect
+    # errors never reached the server, so those are retried for any method.
+    max_retries=Retry(
+        total=3,
+        connect=3,
+        read=2,
+        backoff_factor=0.25,
+        status_forcelist=[429, 502, 503, 504],
+        allowed_methods=frozenset(["GET", "HEAD"])
+    )
+)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+# Every request goes through HTTP so the timeout lives in one place
+HTTP = functools.partial(SESSION.request, timeout=10)
+
+def _warmup():
+    """Resolve the backend host and open a pooled connection before any test is timed"""
+    url = urlparse(BASE_URL)
     try:
-        with open('/app/frontend/.env', 'r') as f:
-            for line in f:
-                if line.startswith('REACT_APP_BACKEND_URL='):
-                    return line.split('=', 1)[1].strip()
-    except:
+        socket.getaddrinfo(url.hostname, url.port or (443 if url.scheme == "https" else 80))
+        SESSION.head(BASE_URL, timeout=5)
+    except (OSError, requests.RequestException):
+        # Warmup is best effort; the health check reports a dead backend
         pass
-    return "http://localhost:8001"
 
-BASE_URL = get_backend_url()
-API_URL = f"{BASE_URL}/api"
+# Opt-in on-disk cache for idempotent GETs; delete the directory to invalidate
+_CACHE_DIR = Path('/tmp/credit_test_cache')
+USE_CACHE = os.getenv('TEST_CACHE', '0') == '1'
+
+# Print details for passing tests too (failures always show them)
+VERBOSE = os.getenv('TEST_VERBOSE', '1') == '1'
+
+def cached_get(url):
+    """GET served from disk when TEST_CACHE=1; retries come from the session adapter"""
+    cache_file = _CACHE_DIR / hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+    if USE_CACHE and cache_file.exists():
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response._content = cache_file.read_bytes()
+        return response
+    
+    response = HTTP('GET', url)
+    
+    if USE_CACHE and response.status_code == 200:
+        _CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        cache_file.write_bytes(response.content)
+    return response
 
 print(f"Testing Credit Approval System Backend APIs")
 print(f"Base URL: {BASE_URL}")
 print(f"API URL: {API_URL}")
 print("=" * 60)
 
-# Test results tracking
-test_results = {
-    "passed": 0,
-    "failed": 0,
-    "errors": []
-}
+# Interest rate per credit score band; band lower bounds in RATE_THRESHOLDS
+RATE_BUCKETS = np.array([15.0, 12.0, 10.0, 8.0])
+RATE_THRESHOLDS = np.array([550, 650, 750])
+
+# Fields each endpoint response must contain
+REGISTRATION_FIELDS = frozenset({"customer_id", "name", "monthly_salary", "approved_limit"})
+CUSTOMER_FIELDS = frozenset({"customer_id", "first_name", "last_name", "monthly_salary", "approved_limit", "current_debt", "credit_score"})
+ELIGIBILITY_FIELDS = frozenset({"customer_id", "approval", "interest_rate", "tenure", "monthly_installment", "credit_score"})
+LOAN_CREATION_FIELDS = frozenset({"loan_id", "customer_id", "loan_approved", "monthly_installment"})
+PAYMENT_FIELDS = frozenset({"message", "loan_id", "payment_amount"})
+STATS_FIELDS = frozenset({"total_customers", "total_loans", "total_loan_amount", "average_payment_rate", "default_rate"})
+INGESTION_FIELDS = frozenset({"message", "processed_customers", "processed_loans"})
+
+def verify_emi(principal, annual_rate, tenure, emi):
+    """Check EMIs against the amortization formula; takes scalars or whole arrays"""
+    monthly_rate = np.asarray(annual_rate, dtype=float) / (12 * 100)
+    factor = (1 + monthly_rate) ** tenure
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected = np.where(monthly_rate == 0, np.divide(principal, tenure), principal * monthly_rate * factor / (factor - 1))
+    return bool(np.allclose(expected, emi, atol=0.01))
+
+def _loan_payload(customer_id, eligibility=None):
+    """Request body shared by check-eligibility and create-loan; create-loan
+    takes the rate the eligibility check settled on"""
+    return {
+        "customer_id": customer_id,
+        "loan_amount": 100000,
+        "interest_rate": eligibility["interest_rate"] if eligibility else 10.0,
+        "tenure": 12
+    }
+
+# Test results tracking: each thread counts into its own Counter, summed
+# when reporting; only failures take a lock, to record the error text
+_errors: list[str] = []
+_errors_lock = threading.Lock()
+_thread_counters: list[Counter] = []
+_local = threading.local()
 
-def log_test(test_name, success, details=""):
-    """Log test results"""
+def _counter():
+    """This thread's pass/fail Counter, registered on first use"""
+    counter = getattr(_local, "counter", None)
+    if counter is None:
+        counter = _local.counter = Counter()
+        with _errors_lock:
+            _thread_counters.append(counter)
+    return counter
+
+def _totals():
+    """Pass/fail counts merged across all threads"""
+    return sum(_thread_counters, Counter())
+
+def log_test(test_name, success, details_fn=None):
+    """Log test results; details_fn is only called when the details get printed"""
     status = "✅ PASS" if success else "❌ FAIL"
-    print(f"{status}: {test_name}")
-    if details:
-        print(f"   Details: {details}")
+    details = details_fn() if details_fn and (VERBOSE or not success) else ""
+    print(f"{status}: {test_name}\n   Details: {details}\n" if details else f"{status}: {test_name}\n")
     
     if success:
-        test_results["passed"] += 1
+        _counter()["passed"] += 1
     else:
-        test_results["failed"] += 1
-        test_results["errors"].append(f"{test_name}: {details}")
-    print()
+        _counter()["failed"] += 1
+        with _errors_lock:
+            _errors.append(f"{test_name}: {details}")
+    
+    # Under pytest a logged failure fails the current test or fixture
+    if not success and "PYTEST_CURRENT_TEST" in os.environ:
+        pytest.fail(f"{test_name}: {details}", pytrace=False)
+
+# Session fixtures let pytest (and pytest-xdist) run each test_* on its own,
+# sharing one registered customer and loan per worker. The fixtures do the
+# HTTP work once through the _helpers; the matching test_* only check results
+WORKFLOW = pytest.mark.xdist_group("workflow")
+
+@pytest.fixture(scope="session", autouse=True)
+def warm_session():
+    _warmup()
+
+@pytest.fixture(scope="session")
+def customer_id():
+    return _register_customer()
+
+@pytest.fixture(scope="session")
+def eligibility_data(customer_id):
+    return _check_eligibility(customer_id)
+
+@pytest.fixture(scope="session")
+def loan_id(customer_id, eligibility_data):
+    return _create_loan(customer_id, eligibility_data)
+
+@pytest.fixture(scope="session")
+def monthly_installment(eligibility_data):
+    return eligibility_data.get("monthly_installment", 0)
 
 def test_health_check():
     """Test 1: Basic health check endpoint"""
     try:
-        response = requests.get(f"{API_URL}/", timeout=10)
+        response = cached_get(URL_HEALTH)
         if response.status_code == 200:
-            data = response.json()
+            data = orjson.loads(response.content)
             if "message" in data and "Credit Approval System" in data["message"]:
-                log_test("Health Check (GET /api/)", True, f"Response: {data}")
+                log_test("Health Check (GET /api/)", True, lambda: f"Response: {data}")
                 return True
             else:
-                log_test("Health Check (GET /api/)", False, f"Unexpected response: {data}")
+                log_test("Health Check (GET /api/)", False, lambda: f"Unexpected response: {data}")
                 return False
         else:
-            log_test("Health Check (GET /api/)", False, f"Status: {response.status_code}, Response: {response.text}")
+            log_test("Health Check (GET /api/)", False, lambda: f"Status: {response.status_code}, Response: {response.content.decode('utf-8', 'replace')}")
             return False
     except Exception as e:
-        log_test("Health Check (GET /api/)", False, f"Exception: {str(e)}")
+        log_test("Health Check (GET /api/)", False, lambda: f"Exception: {str(e)}")
         return False
 
-def test_customer_registration():
-    """Test 2: Customer registration"""
+def _register_customer():
+    """Test 2: Customer registration; returns the new customer_id"""
     try:
         customer_data = {
             "first_name": "John",
@@ -79,303 +231,317 @@ def test_customer_registration():
             "monthly_salary": 50000
         }
         
-        response = requests.post(f"{API_URL}/register", json=customer_data, timeout=10)
+        response = HTTP('POST', URL_REGISTER, json=customer_data)
         if response.status_code == 200:
-            data = response.json()
-            required_fields = ["customer_id", "name", "monthly_salary", "approved_limit"]
-            if all(field in data for field in required_fields):
+            data = orjson.loads(response.content)
+            missing = REGISTRATION_FIELDS - data.keys()
+            if not missing:
                 # Verify approved limit calculation (36x monthly salary)
                 expected_limit = 36 * customer_data["monthly_salary"]
                 if data["approved_limit"] == expected_limit:
                     log_test("Customer Registration (POST /api/register)", True, 
-                           f"Customer ID: {data['customer_id']}, Approved Limit: {data['approved_limit']}")
+                           lambda: f"Customer ID: {data['customer_id']}, Approved Limit: {data['approved_limit']}")
                     return data["customer_id"]
                 else:
                     log_test("Customer Registration (POST /api/register)", False, 
-                           f"Incorrect approved limit. Expected: {expected_limit}, Got: {data['approved_limit']}")
+                           lambda: f"Incorrect approved limit. Expected: {expected_limit}, Got: {data['approved_limit']}")
                     return None
             else:
                 log_test("Customer Registration (POST /api/register)", False, 
-                       f"Missing required fields. Response: {data}")
+                       lambda: f"Missing required fields: {sorted(missing)}. Response: {data}")
                 return None
         else:
             log_test("Customer Registration (POST /api/register)", False, 
-                   f"Status: {response.status_code}, Response: {response.text}")
+                   lambda: f"Status: {response.status_code}, Response: {response.content.decode('utf-8', 'replace')}")
             return None
     except Exception as e:
-        log_test("Customer Registration (POST /api/register)", False, f"Exception: {str(e)}")
+        log_test("Customer Registration (POST /api/register)", False, lambda: f"Exception: {str(e)}")
         return None
 
+@WORKFLOW
+def test_customer_registration(customer_id):
+    assert customer_id
+
+@WORKFLOW
 def test_get_customer(customer_id):
     """Test 3: Get customer profile with credit score"""
     try:
-        response = requests.get(f"{API_URL}/get-customer/{customer_id}", timeout=10)
+        response = cached_get(URL_GET_CUSTOMER.format(customer_id))
         if response.status_code == 200:
-            data = response.json()
-            required_fields = ["customer_id", "first_name", "last_name", "monthly_salary", 
-                             "approved_limit", "current_debt", "credit_score"]
-            if all(field in data for field in required_fields):
+            data = orjson.loads(response.content)
+            missing = CUSTOMER_FIELDS - data.keys()
+            if not missing:
                 # Verify credit score is within valid range
                 credit_score = data["credit_score"]
                 if 300 <= credit_score <= 850:
                     log_test("Get Customer Profile (GET /api/get-customer/{id})", True, 
-                           f"Credit Score: {credit_score}, Total Loans: {data.get('total_loans', 0)}")
+                           lambda: f"Credit Score: {credit_score}, Total Loans: {data.get('total_loans', 0)}")
                     return True
                 else:
                     log_test("Get Customer Profile (GET /api/get-customer/{id})", False, 
-                           f"Invalid credit score: {credit_score}")
+                           lambda: f"Invalid credit score: {credit_score}")
                     return False
             else:
                 log_test("Get Customer Profile (GET /api/get-customer/{id})", False, 
-                       f"Missing required fields. Response: {data}")
+                       lambda: f"Missing required fields: {sorted(missing)}. Response: {data}")
                 return False
         else:
             log_test("Get Customer Profile (GET /api/get-customer/{id})", False, 
-                   f"Status: {response.status_code}, Response: {response.text}")
+                   lambda: f"Status: {response.status_code}, Response: {response.content.decode('utf-8', 'replace')}")
             return False
     except Exception as e:
-        log_test("Get Customer Profile (GET /api/get-customer/{id})", False, f"Exception: {str(e)}")
+        log_test("Get Customer Profile (GET /api/get-customer/{id})", False, lambda: f"Exception: {str(e)}")
         return False
 
-def test_loan_eligibility(customer_id):
-    """Test 4: Loan eligibility check"""
+def _check_eligibility(customer_id):
+    """Test 4: Loan eligibility check; returns the eligibility response"""
     try:
-        eligibility_data = {
-            "customer_id": customer_id,
-            "loan_amount": 100000,
-            "interest_rate": 10.0,
-            "tenure": 12
-        }
-        
-        response = requests.post(f"{API_URL}/check-eligibility", json=eligibility_data, timeout=10)
+        payload = _loan_payload(customer_id)
+        response = HTTP('POST', URL_CHECK, json=payload)
         if response.status_code == 200:
-            data = response.json()
-            required_fields = ["customer_id", "approval", "interest_rate", "tenure", 
-                             "monthly_installment", "credit_score"]
-            if all(field in data for field in required_fields):
+            data = orjson.loads(response.content)
+            missing = ELIGIBILITY_FIELDS - data.keys()
+            if not missing:
                 # Verify business logic
                 credit_score = data["credit_score"]
                 approval = data["approval"]
                 interest_rate = data["interest_rate"]
                 
-                # Check interest rate determination based on credit score
-                expected_rate = 8.0 if credit_score >= 750 else (10.0 if credit_score >= 650 else (12.0 if credit_score >= 550 else 15.0))
+                # Check interest rate determination based on credit score: approved
+                # low-score loans are raised to at least their band's rate
+                band_rate = float(RATE_BUCKETS[np.searchsorted(RATE_THRESHOLDS, credit_score, side='right')])
+                expected_rate = payload["interest_rate"]
+                if approval and credit_score < 650:
+                    expected_rate = max(expected_rate, band_rate)
+                if interest_rate != expected_rate:
+                    log_test("Loan Eligibility Check (POST /api/check-eligibility)", False, 
+                           lambda: f"Interest rate {interest_rate}% for credit score {credit_score}, expected {expected_rate}%")
+                    return None
+                
+                # Check the EMI was amortized at the rate the check settled on
+                emi_ok = verify_emi(payload["loan_amount"], interest_rate, payload["tenure"], data["monthly_installment"])
+                if not emi_ok:
+                    log_test("Loan Eligibility Check (POST /api/check-eligibility)", False, 
+                           lambda: f"EMI {data['monthly_installment']} does not match {interest_rate}% over {payload['tenure']} months")
+                    return None
                 
                 log_test("Loan Eligibility Check (POST /api/check-eligibility)", True, 
-                       f"Approval: {approval}, Credit Score: {credit_score}, Interest Rate: {interest_rate}%")
+                       lambda: f"Approval: {approval}, Credit Score: {credit_score}, Interest Rate: {interest_rate}%")
                 return data
             else:
                 log_test("Loan Eligibility Check (POST /api/check-eligibility)", False, 
-                       f"Missing required fields. Response: {data}")
+                       lambda: f"Missing required fields: {sorted(missing)}. Response: {data}")
                 return None
         else:
             log_test("Loan Eligibility Check (POST /api/check-eligibility)", False, 
-                   f"Status: {response.status_code}, Response: {response.text}")
+                   lambda: f"Status: {response.status_code}, Response: {response.content.decode('utf-8', 'replace')}")
             return None
     except Exception as e:
-        log_test("Loan Eligibility Check (POST /api/check-eligibility)", False, f"Exception: {str(e)}")
+        log_test("Loan Eligibility Check (POST /api/check-eligibility)", False, lambda: f"Exception: {str(e)}")
         return None
 
-def test_loan_creation(customer_id, eligibility_data):
-    """Test 5: Loan creation"""
+@WORKFLOW
+def test_loan_eligibility(eligibility_data):
+    assert eligibility_data
+
+def _create_loan(customer_id, eligibility_data):
+    """Test 5: Loan creation; returns the new loan_id"""
     try:
         if not eligibility_data or not eligibility_data.get("approval"):
-            log_test("Loan Creation (POST /api/create-loan)", False, "Cannot create loan - not eligible")
+            log_test("Loan Creation (POST /api/create-loan)", False, lambda: "Cannot create loan - not eligible")
             return None
             
-        loan_data = {
-            "customer_id": customer_id,
-            "loan_amount": 100000,
-            "interest_rate": eligibility_data["interest_rate"],
-            "tenure": 12
-        }
-        
-        response = requests.post(f"{API_URL}/create-loan", json=loan_data, timeout=10)
+        response = HTTP('POST', URL_CREATE_LOAN, json=_loan_payload(customer_id, eligibility_data))
         if response.status_code == 200:
-            data = response.json()
-            required_fields = ["loan_id", "customer_id", "loan_approved", "monthly_installment"]
-            if all(field in data for field in required_fields):
+            data = orjson.loads(response.content)
+            missing = LOAN_CREATION_FIELDS - data.keys()
+            if not missing:
                 if data["loan_approved"]:
                     log_test("Loan Creation (POST /api/create-loan)", True, 
-                           f"Loan ID: {data['loan_id']}, Monthly EMI: {data['monthly_installment']}")
+                           lambda: f"Loan ID: {data['loan_id']}, Monthly EMI: {data['monthly_installment']}")
                     return data["loan_id"]
                 else:
-                    log_test("Loan Creation (POST /api/create-loan)", False, "Loan not approved")
+                    log_test("Loan Creation (POST /api/create-loan)", False, lambda: "Loan not approved")
                     return None
             else:
                 log_test("Loan Creation (POST /api/create-loan)", False, 
-                       f"Missing required fields. Response: {data}")
+                       lambda: f"Missing required fields: {sorted(missing)}. Response: {data}")
                 return None
         else:
             log_test("Loan Creation (POST /api/create-loan)", False, 
-                   f"Status: {response.status_code}, Response: {response.text}")
+                   lambda: f"Status: {response.status_code}, Response: {response.content.decode('utf-8', 'replace')}")
             return None
     except Exception as e:
-        log_test("Loan Creation (POST /api/create-loan)", False, f"Exception: {str(e)}")
+        log_test("Loan Creation (POST /api/create-loan)", False, lambda: f"Exception: {str(e)}")
         return None
 
+@WORKFLOW
+def test_loan_creation(loan_id):
+    assert loan_id
+
+@WORKFLOW
 def test_view_customer_loans(customer_id):
     """Test 6: View customer's loans"""
     try:
-        response = requests.get(f"{API_URL}/view-loans/{customer_id}", timeout=10)
+        response = cached_get(URL_VIEW_LOANS.format(customer_id))
         if response.status_code == 200:
-            data = response.json()
+            data = orjson.loads(response.content)
             if isinstance(data, list):
                 log_test("View Customer Loans (GET /api/view-loans/{id})", True, 
-                       f"Found {len(data)} loans for customer")
+                       lambda: f"Found {len(data)} loans for customer")
                 return True
             else:
                 log_test("View Customer Loans (GET /api/view-loans/{id})", False, 
-                       f"Expected list, got: {type(data)}")
+                       lambda: f"Expected list, got: {type(data)}")
                 return False
         else:
             log_test("View Customer Loans (GET /api/view-loans/{id})", False, 
-                   f"Status: {response.status_code}, Response: {response.text}")
+                   lambda: f"Status: {response.status_code}, Response: {response.content.decode('utf-8', 'replace')}")
             return False
     except Exception as e:
-        log_test("View Customer Loans (GET /api/view-loans/{id})", False, f"Exception: {str(e)}")
+        log_test("View Customer Loans (GET /api/view-loans/{id})", False, lambda: f"Exception: {str(e)}")
         return False
 
+@WORKFLOW
 def test_make_payment(loan_id, monthly_installment):
     """Test 7: Make EMI payment"""
     try:
         if not loan_id:
-            log_test("Make Payment (POST /api/make-payment/{id})", False, "No loan ID available")
+            log_test("Make Payment (POST /api/make-payment/{id})", False, lambda: "No loan ID available")
             return False
             
         payment_data = {
             "payment_amount": monthly_installment
         }
         
-        response = requests.post(f"{API_URL}/make-payment/{loan_id}", json=payment_data, timeout=10)
+        response = HTTP('POST', URL_PAY.format(loan_id), json=payment_data)
         if response.status_code == 200:
-            data = response.json()
-            required_fields = ["message", "loan_id", "payment_amount"]
-            if all(field in data for field in required_fields):
+            data = orjson.loads(response.content)
+            missing = PAYMENT_FIELDS - data.keys()
+            if not missing:
                 log_test("Make Payment (POST /api/make-payment/{id})", True, 
-                       f"Payment Amount: {data['payment_amount']}, Date: {data.get('payment_date', 'N/A')}")
+                       lambda: f"Payment Amount: {data['payment_amount']}, Date: {data.get('payment_date', 'N/A')}")
                 return True
             else:
                 log_test("Make Payment (POST /api/make-payment/{id})", False, 
-                       f"Missing required fields. Response: {data}")
+                       lambda: f"Missing required fields: {sorted(missing)}. Response: {data}")
                 return False
         else:
             log_test("Make Payment (POST /api/make-payment/{id})", False, 
-                   f"Status: {response.status_code}, Response: {response.text}")
+                   lambda: f"Status: {response.status_code}, Response: {response.content.decode('utf-8', 'replace')}")
             return False
     except Exception as e:
-        log_test("Make Payment (POST /api/make-payment/{id})", False, f"Exception: {str(e)}")
+        log_test("Make Payment (POST /api/make-payment/{id})", False, lambda: f"Exception: {str(e)}")
         return False
 
 def test_system_stats():
     """Test 8: System analytics"""
     try:
-        response = requests.get(f"{API_URL}/get-stats", timeout=10)
+        response = cached_get(URL_STATS)
         if response.status_code == 200:
-            data = response.json()
-            required_fields = ["total_customers", "total_loans", "total_loan_amount", 
-                             "average_payment_rate", "default_rate"]
-            if all(field in data for field in required_fields):
+            data = orjson.loads(response.content)
+            missing = STATS_FIELDS - data.keys()
+            if not missing:
                 log_test("System Statistics (GET /api/get-stats)", True, 
-                       f"Customers: {data['total_customers']}, Loans: {data['total_loans']}, " +
+                       lambda: f"Customers: {data['total_customers']}, Loans: {data['total_loans']}, " +
                        f"Total Amount: {data['total_loan_amount']}")
                 return True
             else:
                 log_test("System Statistics (GET /api/get-stats)", False, 
-                       f"Missing required fields. Response: {data}")
+                       lambda: f"Missing required fields: {sorted(missing)}. Response: {data}")
                 return False
         else:
             log_test("System Statistics (GET /api/get-stats)", False, 
-                   f"Status: {response.status_code}, Response: {response.text}")
+                   lambda: f"Status: {response.status_code}, Response: {response.content.decode('utf-8', 'replace')}")
             return False
     except Exception as e:
-        log_test("System Statistics (GET /api/get-stats)", False, f"Exception: {str(e)}")
+        log_test("System Statistics (GET /api/get-stats)", False, lambda: f"Exception: {str(e)}")
         return False
 
 def test_data_ingestion():
     """Test 9: Data ingestion (Excel upload) - test with empty payload"""
     try:
         # Test with empty payload since we don't have actual Excel files
-        response = requests.post(f"{API_URL}/ingest-data", timeout=10)
+        response = HTTP('POST', URL_INGEST)
         if response.status_code == 200:
-            data = response.json()
-            required_fields = ["message", "processed_customers", "processed_loans"]
-            if all(field in data for field in required_fields):
+            data = orjson.loads(response.content)
+            missing = INGESTION_FIELDS - data.keys()
+            if not missing:
                 log_test("Data Ingestion (POST /api/ingest-data)", True, 
-                       f"Processed Customers: {data['processed_customers']}, " +
+                       lambda: f"Processed Customers: {data['processed_customers']}, " +
                        f"Processed Loans: {data['processed_loans']}")
                 return True
             else:
                 log_test("Data Ingestion (POST /api/ingest-data)", False, 
-                       f"Missing required fields. Response: {data}")
+                       lambda: f"Missing required fields: {sorted(missing)}. Response: {data}")
                 return False
         else:
             log_test("Data Ingestion (POST /api/ingest-data)", False, 
-                   f"Status: {response.status_code}, Response: {response.text}")
+                   lambda: f"Status: {response.status_code}, Response: {response.content.decode('utf-8', 'replace')}")
             return False
     except Exception as e:
-        log_test("Data Ingestion (POST /api/ingest-data)", False, f"Exception: {str(e)}")
+        log_test("Data Ingestion (POST /api/ingest-data)", False, lambda: f"Exception: {str(e)}")
         return False
 
-def run_comprehensive_test():
+async def run_comprehensive_test():
     """Run complete workflow test"""
     print("Starting comprehensive Credit Approval System API testing...")
     print()
     
+    # Phase A: health -> registration -> eligibility -> loan -> payment, in order
     # Test 1: Health check
     if not test_health_check():
         print("❌ Health check failed - stopping tests")
         return
     
     # Test 2: Customer registration
-    customer_id = test_customer_registration()
+    customer_id = _register_customer()
     if not customer_id:
         print("❌ Customer registration failed - stopping workflow tests")
         return
     
-    # Test 3: Get customer profile
-    test_get_customer(customer_id)
-    
-    # Test 4: Check loan eligibility
-    eligibility_data = test_loan_eligibility(customer_id)
+    # Tests 4, 5 and 7: eligibility, loan creation and payment
+    eligibility_data = _check_eligibility(customer_id)
     
-    # Test 5: Create loan
     loan_id = None
     monthly_installment = 0
     if eligibility_data and eligibility_data.get("approval"):
-        loan_id = test_loan_creation(customer_id, eligibility_data)
+        loan_id = _create_loan(customer_id, eligibility_data)
         monthly_installment = eligibility_data.get("monthly_installment", 0)
     
-    # Test 6: View customer loans
-    test_view_customer_loans(customer_id)
-    
-    # Test 7: Make payment
     if loan_id and monthly_installment:
         test_make_payment(loan_id, monthly_installment)
     
-    # Test 8: System statistics
-    test_system_stats()
-    
-    # Test 9: Data ingestion
-    test_data_ingestion()
+    # Phase B: tests 3, 6, 8 and 9 do not depend on each other, run them concurrently
+    await asyncio.gather(
+        asyncio.to_thread(test_get_customer, customer_id),
+        asyncio.to_thread(test_view_customer_loans, customer_id),
+        asyncio.to_thread(test_system_stats),
+        asyncio.to_thread(test_data_ingestion),
+    )
     
     # Print final results
+    totals = _totals()
     print("=" * 60)
     print("FINAL TEST RESULTS:")
-    print(f"✅ Passed: {test_results['passed']}")
-    print(f"❌ Failed: {test_results['failed']}")
-    print(f"Total Tests: {test_results['passed'] + test_results['failed']}")
+    print(f"✅ Passed: {totals['passed']}")
+    print(f"❌ Failed: {totals['failed']}")
+    print(f"Total Tests: {totals.total()}")
     
-    if test_results['failed'] > 0:
+    if totals['failed'] > 0:
         print("\nFAILED TESTS:")
-        for error in test_results['errors']:
+        for error in _errors:
             print(f"  - {error}")
     
-    success_rate = (test_results['passed'] / (test_results['passed'] + test_results['failed'])) * 100
+    success_rate = (totals['passed'] / totals.total()) * 100
     print(f"\nSuccess Rate: {success_rate:.1f}%")
     
-    return test_results['failed'] == 0
+    return totals['failed'] == 0
 
 if __name__ == "__main__":
-    success = run_comprehensive_test()
+    # Block-buffer stdout for the run; flushed explicitly before exiting
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding=sys.stdout.encoding, write_through=False)
+    _warmup()
+    success = asyncio.run(run_comprehensive_test())
+    sys.stdout.flush()
     sys.exit(0 if success else 1)
\ No newline at end of file